@@ -3,47 +3,40 @@ db.py
 Простая работа с SQLite для хранения комнат, гостей и броней
 """
 
+import os
+import queue
 import sqlite3
+import threading
+from contextlib import closing, contextmanager
 from pathlib import Path
 from datetime import date
 
 DB_FILE = Path(__file__).parent / "hotel.db"
 
 
-def init_db(db_path: str = None):
-    """Инициализация базы данных (создание таблиц)."""
-    db_file = DB_FILE if db_path is None else db_path
-    conn = sqlite3.connect(str(db_file))
-    cur = conn.cursor()
-    cur.execute("""
+_TABLES = """
     CREATE TABLE IF NOT EXISTS rooms (
         room_number TEXT PRIMARY KEY,
         room_type TEXT NOT NULL,
         price_per_night REAL NOT NULL,
         is_occupied INTEGER NOT NULL DEFAULT 0
-    )
-    """)
-    cur.execute("""
+    );
     CREATE TABLE IF NOT EXISTS guests (
         guest_id TEXT PRIMARY KEY,
         name TEXT NOT NULL,
         email TEXT,
         phone TEXT
-    )
-    """)
-    cur.execute("""
+    );
     CREATE TABLE IF NOT EXISTS bookings (
         booking_id TEXT PRIMARY KEY,
         guest_id TEXT NOT NULL,
         room_number TEXT NOT NULL,
-        check_in_date TEXT NOT NULL,
-        check_out_date TEXT NOT NULL,
+        check_in_date INTEGER NOT NULL,
+        check_out_date INTEGER NOT NULL,
         status TEXT NOT NULL,
         FOREIGN KEY(guest_id) REFERENCES guests(guest_id),
         FOREIGN KEY(room_number) REFERENCES rooms(room_number)
-    )
-    """)
-    cur.execute("""
+    );
     CREATE TABLE IF NOT EXISTS payments (
         payment_id TEXT PRIMARY KEY,
         booking_id TEXT NOT NULL,
@@ -53,12 +46,183 @@ def init_db(db_path: str = None):
         status TEXT,
         transaction_id TEXT,
         FOREIGN KEY(booking_id) REFERENCES bookings(booking_id)
-    )
-    """)
-    conn.commit()
-    conn.close()
+    );
+"""
+
+def iso_to_ordinal_sql(expr: str) -> str:
+    """SQL-выражение, переводящее ISO-дату в date.toordinal().
+
+    julianday('0001-01-01') = 1721425.5 соответствует ordinal 1;
+    некорректная дата даёт NULL.
+    """
+    return f"CAST(julianday({expr}) - 1721424.5 AS INTEGER)"
+
+
+# старые БД хранили даты брони строками ISO; переводим их в порядковые номера
+_MIGRATE_BOOKING_DATES = f"""
+    CREATE TABLE bookings_new (
+        booking_id TEXT PRIMARY KEY,
+        guest_id TEXT NOT NULL,
+        room_number TEXT NOT NULL,
+        check_in_date INTEGER NOT NULL,
+        check_out_date INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        FOREIGN KEY(guest_id) REFERENCES guests(guest_id),
+        FOREIGN KEY(room_number) REFERENCES rooms(room_number)
+    );
+    INSERT INTO bookings_new
+        SELECT booking_id, guest_id, room_number,
+               {iso_to_ordinal_sql("check_in_date")},
+               {iso_to_ordinal_sql("check_out_date")},
+               status
+        FROM bookings;
+    DROP TABLE bookings;
+    ALTER TABLE bookings_new RENAME TO bookings;
+"""
+
+# частичный индекс только по активным броням: запросы на пересечение дат
+# содержат то же условие по status и ищут по (room_number, check_in_date)
+_INDEXES = """
+    DROP INDEX IF EXISTS idx_bookings_room_status;
+    CREATE INDEX IF NOT EXISTS idx_bookings_room_active_dates
+        ON bookings(room_number, check_in_date, check_out_date)
+        WHERE status NOT IN ('cancelled', 'checked_out');
+    CREATE INDEX IF NOT EXISTS idx_bookings_guest ON bookings(guest_id);
+    CREATE INDEX IF NOT EXISTS idx_payments_booking ON payments(booking_id);
+"""
 
 
-def get_connection(db_path: str = None):
+def _needs_date_migration(conn: sqlite3.Connection) -> bool:
+    """True, если таблица bookings создана со старыми TEXT-датами."""
+    columns = {row[1]: row[2] for row in conn.execute("PRAGMA table_info(bookings)")}
+    return columns.get("check_in_date", "").upper() == "TEXT"
+
+
+def is_memory(db_path) -> bool:
+    """True для базы в памяти: она живёт только внутри своего соединения."""
+    return str(db_path) == ":memory:"
+
+
+def init_db(db_path: str = None, conn: sqlite3.Connection = None):
+    """Инициализация базы данных (создание таблиц).
+
+    WAL и mmap требуют, чтобы каталог с БД был доступен на запись
+    (рядом с файлом создаются -wal и -shm). Если передано conn, схема
+    создаётся в нём: так инициализируется база ':memory:'.
+    """
+    if conn is None:
+        if is_memory(db_path):
+            # отдельное соединение создало бы свою, сразу теряемую БД;
+            # схему создаст ConnectionPool на своём соединении
+            return
+        db_file = DB_FILE if db_path is None else db_path
+        with closing(sqlite3.connect(str(db_file), isolation_level=None)) as own_conn:
+            init_db(conn=own_conn)
+        return
+    # page_size и auto_vacuum применяются только к новой пустой БД и должны
+    # идти до включения WAL; у существующих БД они меняются лишь через VACUUM
+    conn.execute("PRAGMA page_size = 8192")
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    # WAL сохраняется в файле БД, поэтому достаточно включить его один раз
+    conn.execute("PRAGMA journal_mode = WAL")
+    migration = _MIGRATE_BOOKING_DATES if _needs_date_migration(conn) else ""
+    conn.executescript("BEGIN;" + _TABLES + migration + _INDEXES + "COMMIT;")
+
+
+def get_connection(db_path: str = None) -> sqlite3.Connection:
+    """Открывает долгоживущее соединение в режиме автокоммита."""
     db_file = DB_FILE if db_path is None else db_path
-    return sqlite3.connect(str(db_file))
+    # кэш подготовленных выражений живёт столько же, сколько соединение;
+    # 256 мест с запасом вмещают все запросы из hotel.py
+    conn = sqlite3.connect(str(db_file), isolation_level=None, check_same_thread=False,
+                           cached_statements=256)
+    # строки доступны и по индексу, и по имени колонки, dict(row) строится в C
+    conn.row_factory = sqlite3.Row
+    # эти настройки действуют только в рамках соединения
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA cache_size = -20000")
+    conn.execute("PRAGMA mmap_size = 268435456")
+    conn.execute("PRAGMA foreign_keys = ON")
+    return conn
+
+
+class ConnectionPool:
+    """Пул соединений: один зарезервированный писатель и до N читателей.
+
+    В режиме WAL читатели не блокируют писателя и друг друга, поэтому
+    SELECT из разных потоков идут параллельно. Соединения открываются лениво.
+    """
+
+    def __init__(self, db_path: str = None, readers: int = None):
+        self.db_path = db_path
+        if readers is None:
+            readers = min(os.cpu_count() or 1, 8)
+        # у базы в памяти каждое соединение видит свою БД - читаем через писателя
+        self._memory = is_memory(db_path)
+        if self._memory:
+            readers = 0
+        self.readers = readers
+        self._idle: queue.Queue = queue.Queue(maxsize=max(readers, 1))
+        self._opened = 0
+        self._open_lock = threading.Lock()
+        self._writer = None
+        self._write_lock = threading.RLock()
+        self._write_owner = None
+
+    @contextmanager
+    def write(self):
+        """выдаёт соединение-писатель; вложенные вызовы в том же потоке допустимы"""
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = get_connection(self.db_path)
+                if self._memory:
+                    init_db(conn=self._writer)
+            outer = self._write_owner is None
+            self._write_owner = threading.get_ident()
+            try:
+                yield self._writer
+            finally:
+                if outer:
+                    self._write_owner = None
+
+    @contextmanager
+    def read(self):
+        """выдаёт соединение для чтения из пула"""
+        # поток, который держит писателя (например, внутри транзакции),
+        # должен читать через него, иначе не увидит своих незакоммиченных изменений
+        if not self.readers or self._write_owner == threading.get_ident():
+            with self.write() as conn:
+                yield conn
+            return
+        conn = None
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._open_lock:
+                if self._opened < self.readers:
+                    conn = get_connection(self.db_path)
+                    self._opened += 1
+            if conn is None:
+                conn = self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def close(self):
+        """закрывает все соединения; следующий запрос откроет их заново
+
+        База ':memory:' при этом теряет данные.
+        """
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        with self._open_lock:
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                except queue.Empty:
+                    break
+                self._opened -= 1
@@ -0,0 +1,27 @@
+"""
+lifecycle.py
+Закрытие долгоживущих объектов при завершении программы
+"""
+
+import atexit
+import weakref
+from typing import Callable
+
+
+def close_at_exit(obj) -> Callable[[], None]:
+    """Регистрирует obj.close() на выход из программы, не удерживая сам obj.
+
+    atexit.register(obj.close) держал бы объект до конца процесса. Возвращает
+    зарегистрированную функцию - close() снимает её через atexit.unregister().
+    """
+    method = weakref.WeakMethod(obj.close)
+
+    def close():
+        bound = method()
+        if bound is not None:
+            bound()
+
+    atexit.register(close)
+    # объект собран сборщиком мусора - убираем и запись в atexit
+    weakref.finalize(obj, atexit.unregister, close).atexit = False
+    return close
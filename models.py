@@ -7,11 +7,18 @@ from dataclasses import dataclass, field
 from datetime import date
 from typing import Optional, Dict, Any
 from abc import ABC, abstractmethod
+import sys
+
+# slots=True (Python 3.10+) убирает __dict__ у экземпляров: меньше памяти
+# и быстрее доступ к полям; на старых версиях модели остаются обычными
+_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
 
 
 class Person(ABC):
     """Абстрактный класс человека — демонстрация ООП (абстракция + наследование)."""
 
+    __slots__ = ()
+
     @property
     @abstractmethod
     def id(self) -> str:
@@ -24,7 +31,7 @@ class Person(ABC):
         raise NotImplementedError
 
 
-@dataclass
+@dataclass(frozen=True, **_SLOTS)
 class Guest(Person):
     """Модель гостя, наследует абстрактный Person."""
     guest_id: str
@@ -66,7 +73,7 @@ class Guest(Person):
         )
 
 
-@dataclass
+@dataclass(**_SLOTS)
 class Room:
     """Модель комнаты"""
     room_number: str
@@ -106,7 +113,7 @@ class Room:
         )
 
 
-@dataclass
+@dataclass(**_SLOTS)
 class Booking:
     """Модель брони"""
     booking_id: str
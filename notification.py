@@ -1,105 +1,333 @@
 """
 notification.py
-Абстрактный NotificationService и реализации
+Протокол NotificationService и реализации
 """
 
-from abc import ABC, abstractmethod
-from typing import Optional
+import atexit
+import sys
+import threading
+import weakref
+from functools import partial
+from typing import Callable, Dict, Iterable, List, Optional, Protocol, Tuple, runtime_checkable
 
+from lifecycle import close_at_exit
 
-class NotificationService(ABC):
-    """Абстрактный сервис уведомлений (интерфейс)."""
+# шаблоны сообщений разбираются один раз при импорте, а не на каждый вызов
+_TPL_BOOKING_CONFIRMATION = "[Email] to={to} subject=Booking confirmation message=Ваша бронь {bid} подтверждена"
+_TPL_PAYMENT_CONFIRMATION = "[Email] to={to} subject=Payment confirmation message=Оплата {amount} принята"
+_TPL_CHECKIN_REMINDER = "[Email] to={to} subject=Check-in reminder message=Напоминание: заселение {bid}"
+_TPL_CHECKOUT_REMINDER = "[Email] to={to} subject=Check-out reminder message=Напоминание: выселение {bid}"
+_TPL_BOOKING_CANCELLATION = "[Email] to={to} subject=Booking cancelled message=Бронь {bid} отменена"
+_TPL_SMS = "[SMS] to={to} message={message}"
 
-    @abstractmethod
-    def send_booking_confirmation(self, guest_email: Optional[str], booking_id: str):
-        raise NotImplementedError
+# для настоящей почты шаблон делится на тему и текст письма
+_EMAIL_PARTS = {
+    tpl: (tpl.partition(" subject=")[2].partition(" message=")[0],
+          tpl.partition(" message=")[2])
+    for tpl in (_TPL_BOOKING_CONFIRMATION, _TPL_PAYMENT_CONFIRMATION, _TPL_CHECKIN_REMINDER,
+                _TPL_CHECKOUT_REMINDER, _TPL_BOOKING_CANCELLATION)
+}
 
-    @abstractmethod
-    def send_payment_confirmation(self, guest_email: Optional[str], payment_info: dict):
-        raise NotImplementedError
+# события уведомлений: событие X обслуживает метод send_X
+_EVENTS = ("booking_confirmation", "payment_confirmation", "checkin_reminder",
+           "checkout_reminder", "booking_cancellation", "sms_notification")
 
-    @abstractmethod
-    def send_checkin_reminder(self, guest_email: Optional[str], booking_id: str):
-        raise NotImplementedError
 
-    @abstractmethod
-    def send_checkout_reminder(self, guest_email: Optional[str], booking_id: str):
-        raise NotImplementedError
+def _write_lines(lines: List[str]):
+    """Выводит строки в stdout одной записью, по возможности байтами в обход текстового слоя."""
+    # sys.stdout берём в момент вызова: его могут подменить (redirect_stdout в тестах)
+    out = sys.stdout
+    text = "\n".join(lines) + "\n"
+    raw = getattr(out, "buffer", None)
+    if raw is None:
+        out.write(text)
+        out.flush()
+        return
+    # сначала сбрасываем то, что уже лежит в текстовом буфере, чтобы не перепутать порядок вывода
+    out.flush()
+    raw.write(text.encode(out.encoding or "utf-8", out.errors or "strict"))
+    raw.flush()
 
-    @abstractmethod
-    def send_booking_cancellation(self, guest_email: Optional[str], booking_id: str):
-        raise NotImplementedError
 
-    @abstractmethod
-    def send_sms_notification(self, phone: Optional[str], message: str):
-        raise NotImplementedError
+def _flush_buffer(buf: List[str], lock: threading.Lock):
+    """Выводит и очищает буфер сообщений (сам список остаётся тем же объектом)."""
+    with lock:
+        lines = buf[:]
+        buf.clear()
+    if lines:
+        _write_lines(lines)
+
+
+@runtime_checkable
+class NotificationService(Protocol):
+    """Сервис уведомлений (интерфейс): подходит любой объект с этими методами."""
+
+    def send_booking_confirmation(self, guest_email: Optional[str], booking_id: str): ...
+
+    def send_payment_confirmation(self, guest_email: Optional[str], payment_info: dict): ...
+
+    def send_checkin_reminder(self, guest_email: Optional[str], booking_id: str): ...
+
+    def send_checkout_reminder(self, guest_email: Optional[str], booking_id: str): ...
+
+    def send_booking_cancellation(self, guest_email: Optional[str], booking_id: str): ...
+
+    def send_sms_notification(self, phone: Optional[str], message: str): ...
+
+
+class EmailNotification:
+    """Простая реализация email уведомлений (печать в консоль).
 
+    Сообщения копятся в буфере и выводятся одной записью при flush(),
+    при выходе из блока with, а оставшиеся - когда объект удаляется
+    или программа завершается.
+    """
 
-class EmailNotification(NotificationService):
-    """Простая реализация email уведомлений (печать в консоль)."""
+    EVENTS = _EVENTS
 
     def __init__(self, smtp_server: str = "smtp.example.com", smtp_port: int = 25):
         self.smtp_server = smtp_server
         self.smtp_port = smtp_port
+        self._buf: List[str] = []
+        # send_* и flush() могут вызываться из разных потоков (фоновая отправка Hotel)
+        self._buf_lock = threading.Lock()
+        # финализатор держит сам список, а не объект: срабатывает и при сборке
+        # мусора, и при выходе из программы, если объект ещё жив
+        weakref.finalize(self, _flush_buffer, self._buf, self._buf_lock)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+
+    def _emit(self, template: str, **fields) -> bool:
+        """Ставит сообщение в буфер; всегда True, чтобы send_* возвращали результат одной строкой."""
+        line = template.format_map(fields)
+        with self._buf_lock:
+            self._buf.append(line)
+        return True
+
+    def flush(self):
+        """Выводит накопленные сообщения одним вызовом write."""
+        _flush_buffer(self._buf, self._buf_lock)
 
     def send_booking_confirmation(self, guest_email: Optional[str], booking_id: str):
-        if guest_email:
-            print(f"[Email] to={guest_email} subject=Booking confirmation message=Ваша бронь {booking_id} подтверждена")
-            return True
-        return False
+        return bool(guest_email) and self._emit(_TPL_BOOKING_CONFIRMATION, to=guest_email, bid=booking_id)
 
     def send_payment_confirmation(self, guest_email: Optional[str], payment_info: dict):
-        if guest_email:
-            print(f"[Email] to={guest_email} subject=Payment confirmation message=Оплата {payment_info.get('amount')} принята")
-            return True
-        return False
+        return bool(guest_email) and self._emit(_TPL_PAYMENT_CONFIRMATION, to=guest_email, amount=payment_info.get("amount"))
 
     def send_checkin_reminder(self, guest_email: Optional[str], booking_id: str):
-        if guest_email:
-            print(f"[Email] to={guest_email} subject=Check-in reminder message=Напоминание: заселение {booking_id}")
-            return True
-        return False
+        return bool(guest_email) and self._emit(_TPL_CHECKIN_REMINDER, to=guest_email, bid=booking_id)
 
     def send_checkout_reminder(self, guest_email: Optional[str], booking_id: str):
-        if guest_email:
-            print(f"[Email] to={guest_email} subject=Check-out reminder message=Напоминание: выселение {booking_id}")
-            return True
-        return False
+        return bool(guest_email) and self._emit(_TPL_CHECKOUT_REMINDER, to=guest_email, bid=booking_id)
 
     def send_booking_cancellation(self, guest_email: Optional[str], booking_id: str):
-        if guest_email:
-            print(f"[Email] to={guest_email} subject=Booking cancelled message=Бронь {booking_id} отменена")
-            return True
-        return False
+        return bool(guest_email) and self._emit(_TPL_BOOKING_CANCELLATION, to=guest_email, bid=booking_id)
 
     def send_sms_notification(self, phone: Optional[str], message: str):
-        if phone:
-            print(f"[SMS] to={phone} message={message}")
-            return True
-        return False
+        return bool(phone) and self._emit(_TPL_SMS, to=phone, message=message)
 
 
-class SMSNotification(NotificationService):
-    """Простая реализация SMS (печать)."""
+class SMTPEmailNotification(EmailNotification):
+    """Email-уведомления через SMTP.
 
-    def send_booking_confirmation(self, guest_email: Optional[str], booking_id: str):
-        # SMS implementation doesn't use email - not applicable
-        return False
+    Письма копятся до flush() и уходят в одной SMTP-сессии. Соединение
+    открывается при первой отправке и переиспользуется до close();
+    close() вызывается и при выходе из блока with, и при завершении программы.
+    """
 
-    def send_payment_confirmation(self, guest_email: Optional[str], payment_info: dict):
-        return False
+    # SMS по почте не отправляются
+    EVENTS = tuple(e for e in _EVENTS if e != "sms_notification")
 
-    def send_checkin_reminder(self, guest_email: Optional[str], booking_id: str):
-        return False
+    def __init__(self, smtp_server: str = "smtp.example.com", smtp_port: int = 587,
+                 from_addr: str = "noreply@example.com", username: Optional[str] = None,
+                 password: Optional[str] = None, use_tls: bool = True, timeout: float = 10.0):
+        super().__init__(smtp_server, smtp_port)
+        self.from_addr = from_addr
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self._outbox: List[Tuple[str, str, str]] = []
+        self._smtp = None
+        self._lock = threading.Lock()
+        self._close_at_exit = close_at_exit(self)
 
-    def send_checkout_reminder(self, guest_email: Optional[str], booking_id: str):
-        return False
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
 
-    def send_booking_cancellation(self, guest_email: Optional[str], booking_id: str):
-        return False
+    def _emit(self, template: str, **fields) -> bool:
+        parts = _EMAIL_PARTS.get(template)
+        if parts is None:
+            # не email (SMS) - печатаем, как EmailNotification
+            return super()._emit(template, **fields)
+        subject, body = parts
+        message = (fields["to"], subject, body.format_map(fields))
+        with self._buf_lock:
+            self._outbox.append(message)
+        return True
+
+    def _connection(self):
+        """SMTP-соединение, открываемое при первой отправке"""
+        if self._smtp is None:
+            import smtplib
+            smtp = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=self.timeout)
+            smtp.ehlo()
+            if self.use_tls:
+                smtp.starttls()
+                smtp.ehlo()
+            if self.username:
+                smtp.login(self.username, self.password)
+            self._smtp = smtp
+        return self._smtp
+
+    def _drop_connection(self):
+        """бросает соединение без QUIT: следующая отправка откроет новое"""
+        if self._smtp is not None:
+            try:
+                self._smtp.close()
+            except Exception:
+                pass
+            self._smtp = None
+
+    def _send(self, msg):
+        import smtplib
+        try:
+            self._connection().send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # сервер закрыл простаивавшее соединение - переподключаемся один раз
+            self._drop_connection()
+            self._connection().send_message(msg)
+
+    def flush(self):
+        """Отправляет накопленные письма через одно SMTP-соединение.
+
+        Ошибка одного письма не мешает отправке остальных: неотправленные
+        письма возвращаются в очередь до следующего flush(), после чего
+        первая из ошибок пробрасывается вызывающему.
+        """
+        super().flush()
+        with self._buf_lock:
+            outbox, self._outbox = self._outbox, []
+        if not outbox:
+            return
+        import smtplib
+        from email.message import EmailMessage
+        unsent, error = [], None
+        with self._lock:
+            for item in outbox:
+                to, subject, body = item
+                msg = EmailMessage()
+                msg["From"] = self.from_addr
+                msg["To"] = to
+                msg["Subject"] = subject
+                msg.set_content(body)
+                try:
+                    self._send(msg)
+                except OSError as e:  # SMTPException - подкласс OSError
+                    # после отказа сервера по письму сессия жива, иначе её состояние неизвестно
+                    if not isinstance(e, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)):
+                        self._drop_connection()
+                    unsent.append(item)
+                    error = error or e
+        if unsent:
+            with self._buf_lock:
+                self._outbox[:0] = unsent
+            raise error
+
+    def close(self):
+        """Отправляет оставшиеся письма и закрывает SMTP-соединение."""
+        try:
+            self.flush()
+        finally:
+            atexit.unregister(self._close_at_exit)
+            with self._lock:
+                if self._smtp is not None:
+                    try:
+                        self._smtp.quit()
+                    except Exception:
+                        self._smtp.close()
+                    self._smtp = None
+
+
+class SMSNotification:
+    """Простая реализация SMS (печать).
+
+    Email-уведомления к SMS неприменимы: все остальные send_* возвращают False.
+    """
+
+    EVENTS = ("sms_notification",)
 
     def send_sms_notification(self, phone: Optional[str], message: str):
-        if phone:
-            print(f"[SMS] to={phone} message={message}")
-            return True
+        return bool(phone) and self._emit(_TPL_SMS, to=phone, message=message)
+
+    @staticmethod
+    def _emit(template: str, **fields) -> bool:
+        """Сразу выводит сообщение; всегда True, как и EmailNotification._emit."""
+        _write_lines([template.format_map(fields)])
+        return True
+
+    @staticmethod
+    def _noop(*args, **kwargs):
         return False
+
+    def __getattr__(self, name):
+        # вызывается только для отсутствующих атрибутов, send_sms_notification сюда не попадает
+        if name.startswith("send_"):
+            return self._noop
+        raise AttributeError(name)
+
+
+# с Python 3.12 isinstance() для протоколов не видит методы из __getattr__,
+# поэтому класс регистрируется явно: isinstance(..., NotificationService) == True
+NotificationService.register(SMSNotification)
+
+
+class Notifier:
+    """Рассылает уведомления по нескольким каналам.
+
+    Таблица событий строится при добавлении канала: канал получает только
+    события из своего EVENTS, поэтому заглушки вроде email-методов у SMS
+    не вызываются. Объект сам подходит как NotificationService для Hotel.
+    """
+
+    def __init__(self, *channels):
+        self._channels: List[object] = []
+        self._handlers: Dict[str, List[Callable]] = {}
+        for channel in channels:
+            self.add_channel(channel)
+
+    def add_channel(self, channel, events: Optional[Iterable[str]] = None):
+        """подключает канал к событиям (по умолчанию - к channel.EVENTS или ко всем)"""
+        if events is None:
+            events = getattr(channel, "EVENTS", _EVENTS)
+        self._channels.append(channel)
+        for event in events:
+            self._handlers.setdefault(event, []).append(getattr(channel, "send_" + event))
+
+    def dispatch(self, event: str, *args) -> bool:
+        """отправляет событие всем подписанным каналам; True, если хотя бы один отправил"""
+        sent = False
+        for handler in self._handlers.get(event, ()):
+            if handler(*args):
+                sent = True
+        return sent
+
+    def flush(self):
+        """сбрасывает буферы каналов, которые их копят"""
+        for channel in self._channels:
+            flush = getattr(channel, "flush", None)
+            if flush is not None:
+                flush()
+
+    def __getattr__(self, name):
+        # send_X(...) == dispatch("X", ...): так Hotel работает с фасадом как с обычным каналом
+        if name.startswith("send_"):
+            return partial(self.dispatch, name[5:])
+        raise AttributeError(name)
+
+
+NotificationService.register(Notifier)
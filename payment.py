@@ -3,56 +3,84 @@ payment.py
 Модель платежа и простая заглушка процессора платежей
 """
 
-from dataclasses import dataclass, field
-from datetime import datetime
-from typing import Optional
-import uuid
+from operator import attrgetter
+from types import MappingProxyType
+from typing import Any, Iterable, List, Mapping, Optional
+
+# порядок полей совпадает с колонками таблицы payments
+_PAYMENT_FIELDS = ("payment_id", "booking_id", "amount", "payment_date",
+                   "payment_method", "status", "transaction_id")
+# все поля одним вызовом на C-уровне вместо семи обращений к атрибутам
+_get_fields = attrgetter(*_PAYMENT_FIELDS)
+
+
+# secrets и datetime импортируются при первом платеже, а не при импорте модуля;
+# первый вызов подменяет глобальное имя настоящей функцией, дальше импорта нет
+def _token_hex(nbytes: int) -> str:
+    global _token_hex
+    from secrets import token_hex as _token_hex
+    return _token_hex(nbytes)
+
+
+def _now():
+    global _now
+    from datetime import datetime
+    _now = datetime.now
+    return _now()
 
 
-@dataclass
 class Payment:
-    payment_id: str
-    booking_id: str
-    amount: float
-    payment_date: Optional[str] = None
-    payment_method: Optional[str] = None
-    status: str = "pending"  # pending, completed, refunded
-    transaction_id: Optional[str] = None
+    # поля задаются только в __init__, поэтому вместо @dataclass - слоты без __dict__
+    __slots__ = _PAYMENT_FIELDS + ("_details_cache",)
+
+    _SUCCESS_STATUSES = frozenset(("completed", "confirmed"))
 
     def __init__(self, booking_id: str, amount: float, payment_method: Optional[str] = None):
-        self.payment_id = str(uuid.uuid4())
+        self.payment_id = _token_hex(16)
         self.booking_id = booking_id
         self.amount = amount
-        self.payment_date = None
+        self.payment_date: Optional[str] = None
         self.payment_method = payment_method
-        self.status = "pending"
-        self.transaction_id = None
+        self.status = "pending"  # pending, completed, refunded
+        self.transaction_id: Optional[str] = None
+        self._details_cache: Optional[Mapping[str, Any]] = None
 
     def process_payment(self):
         """Имитация обработки платежа."""
         self.status = "completed"
-        self.payment_date = datetime.now().isoformat()
-        self.transaction_id = str(uuid.uuid4())
+        self.payment_date = _now().isoformat(timespec="seconds")
+        self.transaction_id = _token_hex(16)
+        self._details_cache = None
         return self
 
     def confirm_payment(self):
         self.status = "confirmed"
+        self._details_cache = None
         return self
 
     def issue_refund(self):
         self.status = "refunded"
+        self._details_cache = None
         return self
 
-    def get_payment_details(self) -> dict:
-        return {
-            "payment_id": self.payment_id,
-            "booking_id": self.booking_id,
-            "amount": self.amount,
-            "payment_date": self.payment_date,
-            "payment_method": self.payment_method,
-            "status": self.status,
-            "transaction_id": self.transaction_id
-        }
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{k}={v!r}" for k, v in self.get_payment_details().items())
+        return f"Payment({fields})"
+
+    def get_payment_details(self) -> Mapping[str, Any]:
+        """Данные платежа только для чтения; строятся один раз и сбрасываются методами, меняющими статус."""
+        if self._details_cache is None:
+            self._details_cache = MappingProxyType(dict(zip(_PAYMENT_FIELDS, _get_fields(self))))
+        return self._details_cache
+
+    def to_row(self) -> tuple:
+        """Кортеж полей в порядке колонок таблицы payments."""
+        return _get_fields(self)
+
+    @staticmethod
+    def bulk_to_rows(payments: Iterable["Payment"]) -> List[tuple]:
+        """Кортежи полей для пачки платежей (например, для executemany)."""
+        return [_get_fields(p) for p in payments]
 
     def is_successful(self) -> bool:
-        return self.status in ("completed", "confirmed")
+        return self.status in Payment._SUCCESS_STATUSES
@@ -1,44 +1,85 @@
 import unittest
 import tempfile
 import os
+import io
 import json
+import gc
+import smtplib
+import sqlite3
+import threading
+import time
+import weakref
 from datetime import date, timedelta
 from pathlib import Path
+from unittest import mock
+from contextlib import redirect_stdout
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import FrozenInstanceError
 
+import hotel as hotel_module
 from models import Room, Guest
 from hotel import Hotel, HotelError
+from payment import Payment
+from notification import (NotificationService, EmailNotification, SMSNotification,
+                          SMTPEmailNotification, Notifier)
+
+# опорные даты считаются один раз: тест не разъедется, если попадёт на полночь
+_TODAY = date.today()
+_T1 = _TODAY + timedelta(days=1)
+_T4 = _TODAY + timedelta(days=4)
+_T5 = _TODAY + timedelta(days=5)
 
 
 class TestHotel(unittest.TestCase):
-    def setUp(self):
-        """создаем временную БД перед каждым тестом"""
-        self.temp_db = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
-        self.db_path = self.temp_db.name
+    @classmethod
+    def setUpClass(cls):
+        """создаем БД в памяти, временный JSON и отель один раз на весь набор тестов"""
+        # временные файлы кладём в tmpfs, если он есть: без блочного устройства и fsync
+        cls.original_tempdir = tempfile.tempdir
+        if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+            tempfile.tempdir = "/dev/shm"
+
+        # БД в памяти: ни файлов, ни fsync; тесты, которым нужен файл, используют _make_file_hotel()
+        cls.db_path = ":memory:"
         
         # создаем временный JSON файл для тестов
-        self.temp_json = tempfile.NamedTemporaryFile(suffix='.json', delete=False, mode='w')
-        self.temp_json.write('{"rooms": [], "guests": [], "bookings": [], "payments": [], "name": "TestHotel"}')
-        self.temp_json.close()
+        # тем же кодировщиком, что и Hotel: orjson, если установлен, иначе json
+        cls.temp_json = tempfile.NamedTemporaryFile(suffix='.json', delete=False)
+        cls.temp_json.write(hotel_module._encode(
+            {"rooms": [], "guests": [], "bookings": [], "payments": [], "name": "TestHotel"}))
+        cls.temp_json.close()
         
         # Мокаем JSON_FILE для этого отеля
-        import hotel as hotel_module
-        self.original_json_file = hotel_module.JSON_FILE
-        hotel_module.JSON_FILE = Path(self.temp_json.name)
-        
-        # пересоздаем отель с обновленным JSON_FILE
-        self.hotel = Hotel(name="TestHotel", db_path=self.db_path)
+        cls.original_json_file = hotel_module.JSON_FILE
+        hotel_module.JSON_FILE = Path(cls.temp_json.name)
         
-    def tearDown(self):
-        """Удаляем временные файлы после теста"""
-        self.temp_db.close()
-        os.unlink(self.db_path)
+        cls.hotel = Hotel(name="TestHotel", db_path=cls.db_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        """Удаляем временные файлы после всех тестов"""
+        cls.hotel.close()
         
         # восстанавливаем оригинальный JSON_FILE
-        import hotel as hotel_module
-        hotel_module.JSON_FILE = self.original_json_file
+        hotel_module.JSON_FILE = cls.original_json_file
         
         # удаляем временный JSON файл
-        os.unlink(self.temp_json.name)
+        os.unlink(cls.temp_json.name)
+        tempfile.tempdir = cls.original_tempdir
+
+    def setUp(self):
+        """очищаем данные перед каждым тестом: DELETE дешевле, чем новая БД со схемой"""
+        self.hotel.notifier = None
+        self.hotel.reset()
+
+    def _make_file_hotel(self) -> Hotel:
+        """отдельный отель на временном файле БД; закрывается и удаляется после теста"""
+        temp_db = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+        temp_db.close()
+        self.addCleanup(os.unlink, temp_db.name)
+        hotel = Hotel(name="TestHotel", db_path=temp_db.name)
+        self.addCleanup(hotel.close)
+        return hotel
     
 
     # получается мы спользуем уникальные номера с префиксом "test-" чтобы не конфликтовать с main.py
@@ -50,9 +91,8 @@ class TestHotel(unittest.TestCase):
         
         found = self.hotel.find_room("test-210")
         self.assertIsNotNone(found)
-        self.assertEqual(found.room_number, "test-210")
-        self.assertEqual(found.room_type, "single")
-        self.assertEqual(found.price_per_night, 12000.0)
+        self.assertEqual((found.room_number, found.room_type, found.price_per_night),
+                         ("test-210", "single", 12000.0))
     
     def test_register_and_find_guest(self):
         """тест регистрации и поиска гостя"""
@@ -63,6 +103,45 @@ class TestHotel(unittest.TestCase):
         self.assertIsNotNone(found)
         self.assertEqual(found.name, "Алихан Бектаев")
     
+    def test_remove_room_evicts_cache(self):
+        """тест удаления комнаты после того, как она попала в кэш"""
+        self.hotel.add_room(Room("test-211", "single", 12000.0))
+        self.assertIsNotNone(self.hotel.find_room("test-211"))
+
+        self.hotel.remove_room("test-211")
+        self.assertIsNone(self.hotel.find_room("test-211"))
+    
+    def test_find_room_returns_independent_copy(self):
+        """тест: изменение найденной комнаты не портит кэш"""
+        self.hotel.add_room(Room("test-212", "single", 12000.0))
+        found = self.hotel.find_room("test-212")
+        found.is_occupied = True
+        found.price_per_night = 1.0
+
+        again = self.hotel.find_room("test-212")
+        self.assertFalse(again.is_occupied)
+        self.assertEqual(again.price_per_night, 12000.0)
+    
+    def test_remove_booked_room_error(self):
+        """тест запрета удаления комнаты, на которую есть бронь"""
+        self.hotel.add_room(Room("test-212", "single", 12000.0))
+        self.hotel.register_guest(Guest("test-g24", "Арман Жунусов"))
+        check_in = _T1
+        self.hotel.create_booking("test-g24", "test-212", check_in, check_in + timedelta(days=1))
+
+        with self.assertRaises(HotelError):
+            self.hotel.remove_room("test-212")
+        self.assertIsNotNone(self.hotel.find_room("test-212"))
+    
+    def test_cached_guest_is_immutable(self):
+        """тест: гость из кэша неизменяем, поэтому кэш нельзя испортить снаружи"""
+        self.hotel.register_guest(Guest("test-g26", "Жанна Ибраева"))
+        guest = self.hotel.find_guest("test-g26")
+
+        with self.assertRaises(FrozenInstanceError):
+            guest.name = "Другое имя"
+        self.assertEqual(self.hotel.find_guest("test-g26").name, "Жанна Ибраева")
+    
     def test_duplicate_room_error(self):
         """тест ошибки при добавлении дублирующейся комнаты"""
         room = Room("test-215", "double", 20000.0)
@@ -72,6 +151,20 @@ class TestHotel(unittest.TestCase):
         with self.assertRaises(HotelError):
             self.hotel.add_room(Room("test-215", "suite", 45000.0))
     
+    def test_add_rooms_and_register_guests_skip_existing(self):
+        """тест пакетного добавления: существующие записи пропускаются и не перезаписываются"""
+        self.hotel.add_room(Room("test-215", "single", 12000.0))
+
+        added = self.hotel.add_rooms([Room("test-215", "suite", 45000.0), Room("test-216", "double", 20000.0)])
+        self.assertEqual(added, 1)
+        self.assertEqual(self.hotel.find_room("test-215").room_type, "single")
+        self.assertIsNotNone(self.hotel.find_room("test-216"))
+
+        guests = [Guest("test-g40", "Нурлан Абенов"), Guest("test-g41", "Алия Жумабаева")]
+        self.assertEqual(self.hotel.register_guests(guests), 2)
+        self.assertEqual(self.hotel.register_guests(guests), 0)
+        self.assertEqual(self.hotel.find_guest("test-g41").name, "Алия Жумабаева")
+
     def test_duplicate_guest_error(self):
         """тест ошибки при регистрации дублирующегося гостя"""
         guest = Guest("test-g10", "Айгерим Сапар", "aigerim@example.com")
@@ -85,21 +178,20 @@ class TestHotel(unittest.TestCase):
         self.hotel.add_room(Room("test-220", "single", 12000.0))
         self.hotel.register_guest(Guest("test-g11", "Динара Жумабаева"))
         
-        check_in = date.today() + timedelta(days=1)
-        check_out = check_in + timedelta(days=3)
+        check_in = _T1
+        check_out = _T4
         
         booking = self.hotel.create_booking("test-g11", "test-220", check_in, check_out)
         self.assertIsNotNone(booking)
-        self.assertEqual(booking.status, "booked")
-        self.assertEqual(booking.guest_id, "test-g11")
-        self.assertEqual(booking.room_number, "test-220")
+        self.assertEqual((booking.status, booking.guest_id, booking.room_number),
+                         ("booked", "test-g11", "test-220"))
     
     def test_booking_invalid_dates(self):
         """тест создания брони с некорректными датами"""
         self.hotel.add_room(Room("test-225", "double", 20000.0))
         self.hotel.register_guest(Guest("test-g12", "Джурукбаев Зейнур"))
         
-        check_in = date.today() + timedelta(days=5)
+        check_in = _T5
         check_out = check_in - timedelta(days=1)  # Неправильные даты
         
         with self.assertRaises(HotelError):
@@ -109,8 +201,8 @@ class TestHotel(unittest.TestCase):
         """тест создания брони для несуществующего гостя"""
         self.hotel.add_room(Room("test-230", "suite", 45000.0))
         
-        check_in = date.today() + timedelta(days=1)
-        check_out = check_in + timedelta(days=3)
+        check_in = _T1
+        check_out = _T4
         
         with self.assertRaises(HotelError):
             self.hotel.create_booking("nonexistent-guest", "test-230", check_in, check_out)
@@ -119,8 +211,8 @@ class TestHotel(unittest.TestCase):
         """тест создания брони для несуществующей комнаты"""
         self.hotel.register_guest(Guest("test-g13", "Кадыров Тимур"))
         
-        check_in = date.today() + timedelta(days=1)
-        check_out = check_in + timedelta(days=3)
+        check_in = _T1
+        check_out = _T4
         
         # используем номер которого точно нет
         with self.assertRaises(HotelError):
@@ -131,8 +223,8 @@ class TestHotel(unittest.TestCase):
         self.hotel.add_room(Room("test-235", "deluxe", 30000.0))
         self.hotel.register_guest(Guest("test-g14", "Мусабек Гульназ"))
         
-        check_in = date.today() + timedelta(days=1)
-        check_out = check_in + timedelta(days=3)
+        check_in = _T1
+        check_out = _T4
         
         # сначала комната свободна
         self.assertFalse(self.hotel.check_room_availability("test-235", check_in, check_out))
@@ -143,13 +235,29 @@ class TestHotel(unittest.TestCase):
         # теперь занята
         self.assertTrue(self.hotel.check_room_availability("test-235", check_in, check_out))
     
+    def test_room_availability_edges(self):
+        """тест граничных случаев: смежные даты и отменённая бронь не конфликтуют"""
+        self.hotel.add_room(Room("test-236", "single", 12000.0))
+        self.hotel.register_guest(Guest("test-g21", "Асель Жаксылыкова"))
+
+        check_in = _T1
+        check_out = _T4
+        booking = self.hotel.create_booking("test-g21", "test-236", check_in, check_out)
+
+        # заезд в день выезда предыдущего гостя допустим
+        self.assertFalse(self.hotel.check_room_availability("test-236", check_out, check_out + timedelta(days=2)))
+        self.assertTrue(self.hotel.check_room_availability("test-236", check_out - timedelta(days=1), check_out))
+
+        self.hotel.cancel_booking(booking.booking_id)
+        self.assertFalse(self.hotel.check_room_availability("test-236", check_in, check_out))
+    
     def test_cancel_booking(self):
         """тест отмены брони"""
         self.hotel.add_room(Room("test-240", "suite", 45000.0))
         self.hotel.register_guest(Guest("test-g15", "Сания Амангельды"))
         
-        check_in = date.today() + timedelta(days=1)
-        check_out = check_in + timedelta(days=3)
+        check_in = _T1
+        check_out = _T4
         
         booking = self.hotel.create_booking("test-g15", "test-240", check_in, check_out)
         self.hotel.cancel_booking(booking.booking_id)
@@ -164,7 +272,7 @@ class TestHotel(unittest.TestCase):
     
     def test_check_in_out_flow(self):
         """тест заселения и выселения"""
-        today = date.today()
+        today = _TODAY
         
         self.hotel.add_room(Room("test-245", "deluxe", 30000.0))
         self.hotel.register_guest(Guest("test-g16", "Бауыржан Калиев"))
@@ -173,16 +281,53 @@ class TestHotel(unittest.TestCase):
         
         # заселение
         self.hotel.check_in(booking.booking_id, today)
-        checked_in = self.hotel.find_booking(booking.booking_id)
-        self.assertEqual(checked_in.status, "checked_in")
+        self.assertEqual((self.hotel.find_booking(booking.booking_id).status,
+                          self.hotel.find_room("test-245").is_occupied),
+                         ("checked_in", True))
         
         # выселение
         total = self.hotel.check_out(booking.booking_id, today + timedelta(days=2))
-        checked_out = self.hotel.find_booking(booking.booking_id)
-        self.assertEqual(checked_out.status, "checked_out")
-        
         # рроверяем расчет (2 ночи по 30000)
-        self.assertEqual(total, 60000.0)
+        self.assertEqual((self.hotel.find_booking(booking.booking_id).status,
+                          self.hotel.find_room("test-245").is_occupied, total),
+                         ("checked_out", False, 60000.0))
+
+        # платёж записан вместе с выселением
+        history = self.hotel.get_payment_history("test-g16")
+        self.assertEqual([p["amount"] for p in history], [60000.0])
+    
+    def test_check_out_wrong_date_changes_nothing(self):
+        """тест: неудачное выселение не меняет статус и не создаёт платёж"""
+        today = _TODAY
+        self.hotel.add_room(Room("test-246", "single", 12000.0))
+        self.hotel.register_guest(Guest("test-g25", "Дамир Есенов"))
+        booking = self.hotel.create_booking("test-g25", "test-246", today, today + timedelta(days=2))
+        self.hotel.check_in(booking.booking_id, today)
+
+        with self.assertRaises(HotelError):
+            self.hotel.check_out(booking.booking_id, today + timedelta(days=1))
+
+        self.assertEqual(self.hotel.find_booking(booking.booking_id).status, "checked_in")
+        self.assertTrue(self.hotel.find_room("test-246").is_occupied)
+        self.assertEqual(self.hotel.get_payment_history("test-g25"), [])
+
+    def test_check_in_errors_explain_reason(self):
+        """тест: неудачное заселение сообщает причину и ничего не меняет"""
+        today = _TODAY
+        self.hotel.add_room(Room("test-247", "single", 12000.0))
+        self.hotel.register_guest(Guest("test-g26", "Айдана Сейтова"))
+        booking = self.hotel.create_booking("test-g26", "test-247", today, today + timedelta(days=1))
+
+        with self.assertRaisesRegex(HotelError, "Дата заселения"):
+            self.hotel.check_in(booking.booking_id, today + timedelta(days=1))
+        with self.assertRaisesRegex(HotelError, "Бронь не найдена"):
+            self.hotel.check_in("no-such-booking", today)
+        self.hotel.cancel_booking(booking.booking_id)
+        with self.assertRaisesRegex(HotelError, "'booked'"):
+            self.hotel.check_in(booking.booking_id, today)
+
+        self.assertEqual(self.hotel.find_booking(booking.booking_id).status, "cancelled")
+        self.assertFalse(self.hotel.find_room("test-247").is_occupied)
     
     def test_multiple_rooms_availability(self):
         """тест доступности нескольких комнат"""
@@ -196,8 +341,8 @@ class TestHotel(unittest.TestCase):
         
         self.hotel.register_guest(Guest("test-g17", "Гаухар Нургалиева"))
         
-        check_in = date.today() + timedelta(days=1)
-        check_out = check_in + timedelta(days=3)
+        check_in = _T1
+        check_out = _T4
         
         # асе 3 тестовые комнаты доступны
         available = self.hotel.get_available_rooms(check_in, check_out)
@@ -209,28 +354,56 @@ class TestHotel(unittest.TestCase):
         # остается 2 доступных
         available = self.hotel.get_available_rooms(check_in, check_out)
         self.assertEqual(len(available), 2)
+        self.assertEqual(self.hotel.available_rooms_bulk(check_in, check_out), ["test-251", "test-252"])
     
     def test_process_payment(self):
         """тест обработки платежа"""
         self.hotel.add_room(Room("test-255", "deluxe", 30000.0))
         self.hotel.register_guest(Guest("test-g18", "Данияр Сагинтаев"))
         
-        check_in = date.today() + timedelta(days=1)
-        check_out = check_in + timedelta(days=3)
+        check_in = _T1
+        check_out = _T4
         
         booking = self.hotel.create_booking("test-g18", "test-255", check_in, check_out)
         payment = self.hotel.process_payment(booking.booking_id, 60000.0, "card")
         
         self.assertIsNotNone(payment)
         self.assertEqual(payment.status, "completed")
+
+        # платёж попадает в JSON при следующей записи снимка
+        self.hotel.flush()
+        with open(self.temp_json.name, encoding="utf-8") as f:
+            payments = json.load(f)["payments"]
+        self.assertEqual([p["payment_id"] for p in payments], [payment.payment_id])
+    
+    def test_payment_details_follow_status_changes(self):
+        """тест: закэшированные детали платежа обновляются после смены статуса и не меняются снаружи"""
+        payment = Payment("test-b4", 5000.0, "card")
+        self.assertEqual(payment.get_payment_details()["status"], "pending")
+        self.assertIs(payment.get_payment_details(), payment.get_payment_details())
+        with self.assertRaises(TypeError):
+            payment.get_payment_details()["status"] = "hacked"
+
+        payment.process_payment()
+        self.assertEqual(payment.get_payment_details()["status"], "completed")
+        self.assertTrue(payment.is_successful())
+        payment.issue_refund()
+        self.assertEqual(payment.get_payment_details()["status"], "refunded")
+        self.assertFalse(payment.is_successful())
+        self.assertEqual(Payment.bulk_to_rows([payment]), [tuple(payment.get_payment_details().values())])
+
+    def test_payment_for_unknown_booking_error(self):
+        """тест ошибки при оплате несуществующей брони"""
+        with self.assertRaises(HotelError):
+            self.hotel.process_payment("nonexistent", 1000.0)
     
     def test_payment_history(self):
         """ьест истории платежей"""
         self.hotel.add_room(Room("test-260", "suite", 45000.0))
         self.hotel.register_guest(Guest("test-g19", "Айсулу Шаяхметова"))
         
-        check_in = date.today() + timedelta(days=1)
-        check_out = check_in + timedelta(days=3)
+        check_in = _T1
+        check_out = _T4
         
         booking1 = self.hotel.create_booking("test-g19", "test-260", check_in, check_out)
         booking2 = self.hotel.create_booking("test-g19", "test-260", 
@@ -242,6 +415,381 @@ class TestHotel(unittest.TestCase):
         
         history = self.hotel.get_payment_history("test-g19")
         self.assertEqual(len(history), 2)
+        self.assertEqual({p["booking_id"] for p in history}, {booking1.booking_id, booking2.booking_id})
+
+    def test_load_json_skips_duplicates_and_broken_records(self):
+        """тест загрузки состояния из JSON с дубликатами и битыми записями"""
+        self.hotel.add_room(Room("test-270", "single", 12000.0))
+        state = {
+            "name": "TestHotel",
+            "rooms": [
+                {"room_number": "test-270", "room_type": "suite", "price_per_night": 45000.0},
+                {"room_number": "test-271", "room_type": "double", "price_per_night": 20000.0},
+                {"room_type": "broken"}
+            ],
+            "guests": [{"guest_id": "test-g20", "name": "Ержан Ахметов"}],
+            "bookings": [{
+                "booking_id": "test-b1", "guest_id": "test-g20", "room_number": "test-271",
+                "check_in_date": "2030-01-01", "check_out_date": "2030-01-03", "status": "booked"
+            }, {
+                "booking_id": "test-b3", "guest_id": "test-g20", "room_number": "test-271",
+                "check_in_date": "not-a-date", "check_out_date": "2030-01-03"
+            }, {
+                "booking_id": "test-b5", "guest_id": "test-g20", "room_number": "test-271",
+                "check_in_date": "now", "check_out_date": "2030-01-03"
+            }, {
+                "booking_id": "test-b6", "guest_id": "test-g20", "room_number": "test-271",
+                "check_in_date": "2030-01-05 12:00", "check_out_date": "2030-01-07"
+            }, {
+                "booking_id": ["test-b7"], "guest_id": "test-g20", "room_number": "test-271",
+                "check_in_date": "2030-01-08", "check_out_date": "2030-01-09"
+            }, {"booking_id": "test-b4"}],
+            "payments": []
+        }
+        with open(self.temp_json.name, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+
+        self.hotel.load_json()
+
+        # существующая комната не перезаписана, новая добавлена
+        self.assertEqual(self.hotel.find_room("test-270").room_type, "single")
+        self.assertIsNotNone(self.hotel.find_room("test-271"))
+        self.assertEqual(len(self.hotel.list_rooms()), 2)
+        self.assertIsNotNone(self.hotel.find_guest("test-g20"))
+        self.assertEqual(self.hotel.find_booking("test-b1").check_out_date, date(2030, 1, 3))
+        self.assertEqual([b.booking_id for b in self.hotel.list_bookings()], ["test-b1"])
+
+    def test_load_json_skips_non_scalar_fields(self):
+        """тест: запись с вложенным объектом вместо значения пропускается, остальные загружаются"""
+        state = {
+            "name": "TestHotel",
+            "rooms": [{"room_number": "test-273", "room_type": ["suite"], "price_per_night": 1.0},
+                      {"room_number": "test-274", "room_type": "single", "price_per_night": 12000.0}],
+            "guests": [{"guest_id": "test-g27", "name": {"first": "Ержан"}},
+                       {"guest_id": "test-g28", "name": "Ержан Ахметов"}],
+            "bookings": [],
+            "payments": [{"payment_id": "test-p1", "booking_id": "test-b1", "amount": {"x": 1}},
+                         {"payment_id": "test-p2", "booking_id": "test-b1", "amount": 100.0}]
+        }
+        with open(self.temp_json.name, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+
+        self.hotel.load_json()
+
+        self.assertEqual([r.room_number for r in self.hotel.list_rooms()], ["test-274"])
+        self.assertIsNone(self.hotel.find_guest("test-g27"))
+        self.assertIsNotNone(self.hotel.find_guest("test-g28"))
+        self.hotel.flush()
+        with open(self.temp_json.name, encoding="utf-8") as f:
+            self.assertEqual([p["payment_id"] for p in json.load(f)["payments"]], ["test-p2"])
+
+    def test_load_json_without_new_rows_keeps_file(self):
+        """тест: загрузка снимка, который уже целиком есть в БД, не помечает состояние изменённым"""
+        self.hotel.add_room(Room("test-272", "single", 12000.0))
+        self.hotel.flush()
+
+        self.hotel.load_json()
+        self.assertFalse(self.hotel._dirty)
+
+    def test_json_written_on_flush(self):
+        """тест отложенной записи JSON: изменения попадают в файл после flush()"""
+        self.hotel.add_room(Room("test-275", "double", 20000.0))
+        with open(self.temp_json.name, encoding="utf-8") as f:
+            self.assertEqual(json.load(f)["rooms"], [])
+
+        self.hotel.flush()
+        with open(self.temp_json.name, encoding="utf-8") as f:
+            rooms = json.load(f)["rooms"]
+        self.assertEqual([r["room_number"] for r in rooms], ["test-275"])
+
+    def test_concurrent_saves_do_not_collide(self):
+        """тест: одновременные save_json() из разных потоков не мешают друг другу"""
+        self.hotel.add_room(Room("test-278", "single", 12000.0))
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            list(pool.map(lambda _: self.hotel.save_json(), range(16)))
+
+        with open(self.temp_json.name, encoding="utf-8") as f:
+            self.assertEqual([r["room_number"] for r in json.load(f)["rooms"]], ["test-278"])
+        self.assertFalse(self.hotel._dirty)
+
+    def test_bulk_saves_json_once_on_exit(self):
+        """тест пакетного режима: внутри bulk() JSON не пишется даже при достижении SAVE_EVERY"""
+        with mock.patch.object(hotel_module, "SAVE_EVERY", 1):
+            with self.hotel.bulk():
+                self.hotel.add_room(Room("test-276", "single", 12000.0))
+                self.hotel.add_room(Room("test-277", "double", 20000.0))
+                with open(self.temp_json.name, encoding="utf-8") as f:
+                    self.assertEqual(json.load(f)["rooms"], [])
+
+        with open(self.temp_json.name, encoding="utf-8") as f:
+            rooms = [r["room_number"] for r in json.load(f)["rooms"]]
+        self.assertEqual(sorted(rooms), ["test-276", "test-277"])
+        self.assertFalse(self.hotel._dirty)
+
+    def test_init_db_migrates_text_dates(self):
+        """тест миграции старой схемы с датами брони в виде ISO-строк"""
+        old_db = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+        old_db.close()
+        conn = sqlite3.connect(old_db.name)
+        conn.execute("""CREATE TABLE bookings (booking_id TEXT PRIMARY KEY, guest_id TEXT NOT NULL,
+                        room_number TEXT NOT NULL, check_in_date TEXT NOT NULL,
+                        check_out_date TEXT NOT NULL, status TEXT NOT NULL)""")
+        conn.execute("INSERT INTO bookings VALUES ('test-b2', 'g1', '101', '2025-12-05', '2025-12-07', 'booked')")
+        conn.commit()
+        conn.close()
+
+        hotel = Hotel(name="TestHotel", db_path=old_db.name)
+        try:
+            booking = hotel.find_booking("test-b2")
+            self.assertEqual((booking.check_in_date, booking.check_out_date),
+                             (date(2025, 12, 5), date(2025, 12, 7)))
+        finally:
+            hotel.close()
+            os.unlink(old_db.name)
+
+    def test_json_roundtrip_without_orjson(self):
+        """тест сохранения JSON стандартной библиотекой, если orjson не установлен"""
+        self.hotel.register_guest(Guest("test-g22", "Әлия Серікова", "aliya@example.com"))
+        original_orjson = hotel_module.orjson
+        hotel_module.orjson = None
+        try:
+            self.hotel.save_json()
+        finally:
+            hotel_module.orjson = original_orjson
+
+        with open(self.temp_json.name, encoding="utf-8") as f:
+            guests = json.load(f)["guests"]
+        self.assertEqual(guests[0]["name"], "Әлия Серікова")
+
+    def test_notifications_sent_in_background(self):
+        """тест фоновой отправки уведомлений: close() дожидается очереди"""
+        notifier = mock.Mock()
+        notifier.send_booking_confirmation.side_effect = RuntimeError("smtp down")
+        # отдельный отель: close() общего уничтожил бы его базу в памяти
+        hotel = Hotel(name="TestHotel", db_path=":memory:", notifier=notifier)
+        self.addCleanup(hotel.close)
+        hotel.add_room(Room("test-280", "single", 12000.0))
+        hotel.register_guest(Guest("test-g23", "Мадина Оспанова", "madina@example.com", "+77015556677"))
+
+        check_in = _T1
+        booking = hotel.create_booking("test-g23", "test-280", check_in, check_in + timedelta(days=1))
+        hotel.cancel_booking(booking.booking_id)
+        hotel.close()
+
+        # ошибка одного уведомления не мешает отправке следующих
+        notifier.send_booking_confirmation.assert_called_once_with("madina@example.com", booking.booking_id)
+        notifier.send_booking_cancellation.assert_called_once_with("madina@example.com", booking.booking_id)
+        notifier.send_sms_notification.assert_called_once()
+
+    def test_notification_worker_started_once(self):
+        """тест: параллельные уведомления запускают один фоновый поток, close() его останавливает"""
+        hotel = Hotel(name="TestHotel", db_path=":memory:", notifier=mock.Mock())
+        self.addCleanup(hotel.close)
+        real_thread = hotel_module.threading.Thread
+
+        def slow_thread(*args, **kwargs):
+            # окно между проверкой и запуском потока, в которое попадают остальные вызовы
+            time.sleep(0.05)
+            return real_thread(*args, **kwargs)
+
+        barrier = threading.Barrier(8)
+
+        def notify(i):
+            barrier.wait()
+            hotel._notify("send_sms_notification", "+7701", str(i))
+
+        callers = [threading.Thread(target=notify, args=(i,)) for i in range(8)]
+        with mock.patch("threading.Thread", side_effect=slow_thread) as thread_cls:
+            for caller in callers:
+                caller.start()
+            for caller in callers:
+                caller.join()
+        workers = [c for c in thread_cls.call_args_list if c.kwargs.get("target") == hotel._notification_worker]
+        self.assertEqual(len(workers), 1)
+
+        hotel.close()
+        self.assertEqual(hotel.notifier.send_sms_notification.call_count, 8)
+
+    def test_email_notifications_are_buffered(self):
+        """тест: email-уведомления копятся и выводятся одной пачкой при выходе из with"""
+        out = io.StringIO()
+        with redirect_stdout(out):
+            with EmailNotification() as notifier:
+                self.assertIsInstance(notifier, NotificationService)
+                self.assertTrue(notifier.send_booking_confirmation("a@example.com", "test-b1"))
+                self.assertFalse(notifier.send_booking_confirmation(None, "test-b2"))
+                notifier.send_sms_notification("+996555000001", "привет")
+                self.assertEqual(out.getvalue(), "")
+
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn("test-b1", lines[0])
+        self.assertTrue(lines[1].startswith("[SMS]"))
+
+    def test_email_flush_writes_bytes_after_pending_text(self):
+        """тест: пачка уведомлений пишется байтами в stdout.buffer после уже выведенного текста"""
+        raw = io.BytesIO()
+        stdout = io.TextIOWrapper(raw, encoding="utf-8")
+        with mock.patch("sys.stdout", stdout):
+            notifier = EmailNotification()
+            notifier.send_booking_cancellation("a@example.com", "test-b3")
+            print("до отправки")
+            notifier.flush()
+
+        self.assertEqual(raw.getvalue().decode("utf-8").splitlines(),
+                         ["до отправки", "[Email] to=a@example.com subject=Booking cancelled message=Бронь test-b3 отменена"])
+
+    def test_email_notifications_printed_without_flush(self):
+        """тест: сообщения без flush() выводятся, когда объект удаляется"""
+        out = io.StringIO()
+        with redirect_stdout(out):
+            EmailNotification().send_booking_confirmation("a@example.com", "test-b1")
+            gc.collect()
+        self.assertEqual(out.getvalue().splitlines(),
+                         ["[Email] to=a@example.com subject=Booking confirmation message=Ваша бронь test-b1 подтверждена"])
+
+    def test_email_notifications_not_lost_across_threads(self):
+        """тест: flush() во время отправки из других потоков не теряет сообщений"""
+        notifier = EmailNotification()
+        out = io.StringIO()
+
+        def send(i):
+            for j in range(500):
+                notifier.send_sms_notification("+7701", f"{i}-{j}")
+                if j % 50 == 0:
+                    notifier.flush()
+
+        with redirect_stdout(out):
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                list(pool.map(send, range(4)))
+            notifier.flush()
+        self.assertEqual(len(out.getvalue().splitlines()), 2000)
+
+    def test_smtp_notifications_share_one_connection(self):
+        """тест: пачка писем уходит через одно SMTP-соединение, close() его закрывает"""
+        with mock.patch("smtplib.SMTP") as smtp_cls:
+            with SMTPEmailNotification(from_addr="hotel@example.com", use_tls=False) as notifier:
+                self.assertTrue(notifier.send_booking_confirmation("a@example.com", "test-b6"))
+                self.assertFalse(notifier.send_checkin_reminder(None, "test-b6"))
+                notifier.send_booking_cancellation("b@example.com", "test-b7")
+                notifier.flush()
+                smtp_cls.return_value.send_message.side_effect = [smtplib.SMTPServerDisconnected(), None]
+                notifier.send_payment_confirmation("a@example.com", {"amount": 60000.0})
+
+        smtp = smtp_cls.return_value
+        # второе соединение открыто только после обрыва первого
+        self.assertEqual(smtp_cls.call_count, 2)
+        sent = [c.args[0] for c in smtp.send_message.call_args_list]
+        self.assertEqual([(m["To"], m["Subject"]) for m in sent],
+                         [("a@example.com", "Booking confirmation"),
+                          ("b@example.com", "Booking cancelled"),
+                          ("a@example.com", "Payment confirmation"),
+                          ("a@example.com", "Payment confirmation")])
+        self.assertEqual(sent[0].get_content().strip(), "Ваша бронь test-b6 подтверждена")
+        smtp.quit.assert_called_once()
+
+    def test_smtp_failed_message_stays_queued(self):
+        """тест: ошибка на одном письме не мешает отправить следующие, неотправленное остаётся в очереди"""
+        with mock.patch("smtplib.SMTP") as smtp_cls:
+            notifier = SMTPEmailNotification(use_tls=False)
+            for bid in ("test-b1", "test-b2", "test-b3"):
+                notifier.send_booking_confirmation(f"{bid}@example.com", bid)
+            smtp = smtp_cls.return_value
+            smtp.send_message.side_effect = [None, smtplib.SMTPRecipientsRefused({}), None]
+            with self.assertRaises(smtplib.SMTPRecipientsRefused):
+                notifier.flush()
+
+            sent = [c.args[0]["To"] for c in smtp.send_message.call_args_list]
+            self.assertEqual(sent, ["test-b1@example.com", "test-b2@example.com", "test-b3@example.com"])
+            self.assertEqual([to for to, _, _ in notifier._outbox], ["test-b2@example.com"])
+
+            # следующий flush() досылает письмо через то же соединение
+            smtp.send_message.side_effect = None
+            notifier.close()
+        self.assertEqual(smtp.send_message.call_args_list[-1].args[0]["To"], "test-b2@example.com")
+        self.assertEqual(smtp_cls.call_count, 1)
+        self.assertEqual(notifier._outbox, [])
+
+    def test_close_at_exit_does_not_keep_objects_alive(self):
+        """тест: регистрация close() на выход из программы не мешает сборщику мусора"""
+        with mock.patch("atexit.register") as register, mock.patch("atexit.unregister") as unregister:
+            hotel = Hotel(name="TestHotel", db_path=":memory:")
+            notifier = SMTPEmailNotification(use_tls=False)
+            refs = [weakref.ref(hotel), weakref.ref(notifier)]
+            hooks = [hotel._close_at_exit, notifier._close_at_exit]
+            del hotel, notifier
+            gc.collect()
+
+        self.assertEqual([ref() for ref in refs], [None, None])
+        self.assertEqual([c.args[0] for c in register.call_args_list], hooks)
+        self.assertEqual(sorted(map(id, (c.args[0] for c in unregister.call_args_list))), sorted(map(id, hooks)))
+        # хук собранного объекта ничего не делает
+        hooks[0]()
+
+    def test_sms_notification_skips_email_methods(self):
+        """тест: SMSNotification отвечает False на email-уведомления и печатает только SMS"""
+        notifier = SMSNotification()
+        self.assertIsInstance(notifier, NotificationService)
+
+        out = io.StringIO()
+        with redirect_stdout(out):
+            self.assertFalse(notifier.send_booking_confirmation("a@example.com", "test-b1"))
+            self.assertFalse(notifier.send_payment_confirmation("a@example.com", {"amount": 1}))
+            self.assertTrue(notifier.send_sms_notification("+996555000002", "привет"))
+        self.assertEqual(out.getvalue(), "[SMS] to=+996555000002 message=привет\n")
+
+        with self.assertRaises(AttributeError):
+            notifier.unknown_method
+
+    def test_notifier_dispatches_only_to_subscribed_channels(self):
+        """тест фасада Notifier: событие получают только каналы, которые его обслуживают"""
+        email = mock.Mock(EVENTS=("booking_confirmation",))
+        sms = SMSNotification()
+        notifier = Notifier(email, sms)
+        self.assertIsInstance(notifier, NotificationService)
+
+        out = io.StringIO()
+        with redirect_stdout(out):
+            notifier.send_booking_confirmation("a@example.com", "test-b5")
+            self.assertFalse(notifier.dispatch("checkout_reminder", "a@example.com", "test-b5"))
+            self.assertTrue(notifier.send_sms_notification("+996555000003", "привет"))
+
+        email.send_booking_confirmation.assert_called_once_with("a@example.com", "test-b5")
+        email.send_sms_notification.assert_not_called()
+        self.assertEqual(out.getvalue(), "[SMS] to=+996555000003 message=привет\n")
+
+    def test_close_reopens_connection(self):
+        """тест повторного открытия соединения после close()"""
+        hotel = self._make_file_hotel()
+        hotel.add_room(Room("test-265", "single", 12000.0))
+        hotel.close()
+
+        found = hotel.find_room("test-265")
+        self.assertIsNotNone(found)
+
+    def test_parallel_reads_during_writes(self):
+        """тест чтения из нескольких потоков параллельно с записью"""
+        # пул читателей работает только с файловой БД
+        self.hotel = self._make_file_hotel()
+        check_in = _T1
+        self.hotel.register_guest(Guest("test-g30", "Aibek", "aibek@example.com", "+996555000030"))
+        for i in range(20):
+            self.hotel.add_room(Room(f"test-3{i:02d}", "single", 12000.0))
+
+        def book(i):
+            self.hotel.create_booking("test-g30", f"test-3{i:02d}", check_in, check_in + timedelta(days=1))
+
+        def read(_):
+            return len(self.hotel.get_available_rooms(check_in, check_in + timedelta(days=1)))
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            writes = [pool.submit(book, i) for i in range(20)]
+            counts = list(pool.map(read, range(40)))
+            for w in writes:
+                w.result()
+
+        self.assertTrue(all(0 <= c <= 20 for c in counts))
+        self.assertEqual(self.hotel.get_available_rooms(check_in, check_in + timedelta(days=1)), [])
 
 
 if __name__ == "__main__":